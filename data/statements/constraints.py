@@ -6,11 +6,13 @@
 import yaml
 import sys
 
-try:
-    with open("constraints.yaml", "r") as constraints:
-        constraints = yaml.safe_load(constraints)
+# Prefer the libyaml-backed loader when available, it's much faster.
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-        global_variables = globals()
-        global_variables |= constraints
+try:
+    # temporaries are underscore names, which are not exported by import *
+    with open("constraints.yaml", "r", encoding="utf-8") as _f:
+        globals().update(yaml.load(_f, Loader=_Loader))
+    del _f
 except FileNotFoundError:
     sys.stderr.write("No constraints.yaml file found")
@@ -3,8 +3,9 @@
 # pylint: disable=wildcard-import
 # pylint: disable=invalid-name
 
+import pathlib
 import sys
 from limiti import *
 
-infile = open(sys.argv[1]).read().splitlines()
-assert 0 <= int(infile[0]) <= MAX_N
+data = pathlib.Path(sys.argv[1]).read_bytes()
+assert 0 <= int(data.split(b"\n", 1)[0]) <= MAX_N
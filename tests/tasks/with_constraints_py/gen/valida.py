@@ -3,19 +3,22 @@
 # pylint: disable=wildcard-import
 # pylint: disable=invalid-name
 
+import pathlib
 import sys
 from constraints import *
 
-def run(file: list[str], st: int):
-    assert len(file) == 1
-    N = int(file[0].strip())
+def run(first: bytes, rest: bytes, st: int):
+    assert not rest
+    N = int(first.strip())
     assert 1 <= N <= subtasks[st]['MAXN']
 
 assert len(sys.argv) >= 2
-file = open(sys.argv[1]).read().splitlines()
+data = pathlib.Path(sys.argv[1]).read_bytes()
+# the input must consist of a single line
+first, _, rest = data.partition(b"\n")
 
 st = 0
 if len(sys.argv) >= 3:
     st = int(sys.argv[2])
 
-run(file, st)
+run(first, rest, st)
@@ -1,44 +1,52 @@
 #!/usr/bin/env python3
 
 import argparse
+import threading
 
 import sqlite3
-from flask import Flask, g, Response
+from flask import Flask, Response
 
 app = Flask("task-maker tests")
 database_path = None
+STREAM_CHUNK_SIZE = 64 * 1024
 
+# Row templates of the listings, formatted with the C-implemented % operator.
+INDEX_SESSION_ROW = """
+            <li>
+                <a href="/session/%(id)s">
+                    Session <strong>%(id)s</strong>:
+                    %(version)s started at %(start_time)s
+                </a>
+            </li>
+        """
+SESSION_TASK_ROW = """
+            <tr>
+                <td>%s</td>
+                <td><a href="/session/%s/task/%s">%s</a></td>
+                <td>%s %s</td>
+            </tr>
+        """
 
-def get_db():
-    db = getattr(g, '_database', None)
-    if db is None:
-        db = g._database = sqlite3.connect(database_path)
-    db.row_factory = sqlite3.Row
-    return db
+_db = None
+_db_lock = threading.Lock()
 
 
-@app.teardown_appcontext
-def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+def get_db():
+    # A single long-lived connection is shared by all the requests. The app
+    # only reads from the database, so it's safe to use it from many threads.
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = sqlite3.connect(database_path, check_same_thread=False)
+            _db.row_factory = sqlite3.Row
+    return _db
 
 
 @app.route("/")
 def index():
     cur = get_db().cursor()
-    cur.execute("SELECT * FROM sessions")
-    sessions = []
-    for session in cur.fetchall():
-        sessions.append(f"""
-            <li>
-                <a href="/session/{session["id"]}">
-                    Session <strong>{session["id"]}</strong>:
-                    {session["version"]} started at {session["start_time"]}
-                </a>
-            </li>
-        """)
-    sessions = "\n".join(sessions)
+    cur.execute("SELECT id, version, start_time FROM sessions")
+    sessions = "\n".join(INDEX_SESSION_ROW % session for session in cur)
     return f"""
         <h1>Task maker test</h1>
         <ul>
@@ -50,32 +58,16 @@ def index():
 @app.route("/session/<id>")
 def session(id):
     cur = get_db().cursor()
-    cur.execute("SELECT * FROM sessions WHERE id = ?", (id,))
-    session = cur.fetchall()
-    if not session:
+    cur.execute("SELECT id, version, start_time FROM sessions WHERE id = ?",
+                (id,))
+    session = cur.fetchone()
+    if session is None:
         return "Session not found"
-    session = session[0]
-    tasks = []
     cur.execute(
         "SELECT task_name, return_code, killed FROM tests WHERE session_id = ? ORDER BY task_name",
         (session["id"],))
-    for i, task in enumerate(cur.fetchall()):
-        if task["killed"]:
-            killed = """<span style="color: red">[killed]<span>"""
-        else:
-            killed = ""
-        if task["return_code"] == 0:
-            status = """<span style="color: green">[OK]<span>"""
-        else:
-            status = """<span style="color: red">[broken]<span>"""
-        tasks.append(f"""
-            <tr>
-                <td>{i}</td>
-                <td><a href="/session/{session["id"]}/task/{task["task_name"]}">{task["task_name"]}</a></td>
-                <td>{killed} {status}</td>
-            </tr>
-        """)
-    tasks = "\n".join(tasks)
+    tasks = "\n".join(session_task_row(session["id"], i, task)
+                      for i, task in enumerate(cur))
     return f"""
         <h1>Session {session["id"]}</h1>
         <strong>Version</strong>: {session["version"]}<br>
@@ -87,15 +79,29 @@ def session(id):
     """
 
 
+def session_task_row(session_id, i, task):
+    if task["killed"]:
+        killed = """<span style="color: red">[killed]<span>"""
+    else:
+        killed = ""
+    if task["return_code"] == 0:
+        status = """<span style="color: green">[OK]<span>"""
+    else:
+        status = """<span style="color: red">[broken]<span>"""
+    return SESSION_TASK_ROW % (i, session_id, task["task_name"],
+                               task["task_name"], killed, status)
+
+
 @app.route("/session/<id>/task/<name>")
 def task(id, name):
     cur = get_db().cursor()
-    cur.execute("SELECT * FROM tests WHERE task_name = ? AND session_id = ?",
-                (name, id))
-    task = cur.fetchall()
-    if not task:
+    cur.execute(
+        "SELECT task_name, start_time, duration, killed, return_code, stderr "
+        "FROM tests WHERE task_name = ? AND session_id = ?",
+        (name, id))
+    task = cur.fetchone()
+    if task is None:
         return "Task not found"
-    task = task[0]
     stderr = task["stderr"]
     if isinstance(stderr, bytes):
         stderr = stderr.decode()
@@ -114,15 +120,29 @@ def task(id, name):
 
 @app.route("/session/<id>/task/<name>/stdout")
 def task_stdout(id, name):
-    cur = get_db().cursor()
+    db = get_db()
+    cur = db.cursor()
     cur.execute(
-        "SELECT stdout FROM tests WHERE task_name = ? AND session_id = ?",
+        "SELECT rowid FROM tests WHERE task_name = ? AND session_id = ?",
         (name, id))
-    task = cur.fetchall()
-    if not task:
+    task = cur.fetchone()
+    if task is None:
         return "Task not found"
-    task = task[0]
-    return Response(task["stdout"], mimetype="text/plain")
+    return Response(stream_stdout(db, task["rowid"]), mimetype="text/plain")
+
+
+def stream_stdout(db, rowid):
+    # Incremental blob I/O is only available since Python 3.11
+    if not hasattr(db, "blobopen"):
+        cur = db.cursor()
+        cur.execute("SELECT stdout FROM tests WHERE rowid = ?", (rowid,))
+        row = cur.fetchone()
+        if row is not None:
+            yield row["stdout"]
+        return
+    with db.blobopen("tests", "stdout", rowid, readonly=True) as blob:
+        while chunk := blob.read(STREAM_CHUNK_SIZE):
+            yield chunk
 
 
 if __name__ == '__main__':
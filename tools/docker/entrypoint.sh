@@ -9,28 +9,53 @@ spawn_worker=${SPAWN_WORKER:-true}
 export RUST_LOG=info
 export RUST_BACKTRACE=1
 
-server_store=$(mktemp -d tmserver.XXXXXXX -p /tmp)
-worker_store=$(mktemp -d tmworker.XXXXXXX -p /tmp)
-
+# the stores are created only when the corresponding process is spawned, the
+# arguments (e.g. `exec`) are prepended to the command
 function spawn_server() {
-  task-maker-rust --store-dir "$server_store" $server_args --server
+  local server_store
+  server_store=$(mktemp -d tmserver.XXXXXXX -p /tmp)
+  "$@" task-maker-rust --store-dir "$server_store" $server_args --server
 }
 function spawn_worker() {
-  task-maker-rust --store-dir "$worker_store" $worker_args --worker $server_addr
+  local worker_store
+  worker_store=$(mktemp -d tmworker.XXXXXXX -p /tmp)
+  "$@" task-maker-rust --store-dir "$worker_store" $worker_args --worker $server_addr
+}
+
+# check, without connecting to it, whether the server listens on server_addr
+function server_listening() {
+  if [[ $server_addr == unix://* ]]; then
+    [[ -S ${server_addr#unix://} ]]
+    return
+  fi
+  local port=${server_addr##*:}
+  [[ $port =~ ^[0-9]+$ ]] || return 1
+  # a local address with that port in the listening state (0A)
+  grep -qE "^ *[0-9]+: [0-9A-F]+:$(printf '%04X' "$port") [0-9A-F:]+ 0A " \
+    /proc/net/tcp /proc/net/tcp6 2>/dev/null
 }
 
+# wait (at most 2 seconds) until the server is listening on server_addr
+function wait_for_server() {
+  for attempt in $(seq 20); do
+    server_listening && return 0
+    sleep 0.1s
+  done
+}
+
+# with a single process to spawn, replace this shell with it
 # worker only
 if [[ $spawn_server != true && $spawn_worker == true ]]; then
-  spawn_worker
+  spawn_worker exec
 # server only
 elif [[ $spawn_server == true && $spawn_worker != true ]]; then
-  spawn_server
+  spawn_server exec
 # server+worker
 elif [[ $spawn_server == true && $spawn_worker == true ]]; then
   # run the workers in background, but wait for the server
-  ( sleep 2s && spawn_worker ) &
+  ( wait_for_server; spawn_worker ) &
   spawn_server
 # nothing to spawn
 else
-  bash
+  exec bash
 fi
\ No newline at end of file
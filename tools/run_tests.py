@@ -2,17 +2,21 @@
 
 import argparse
 import datetime
-import glob
 import os
 import os.path
 import subprocess
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import sqlite3
 
 TIMEOUT = 3 * 60  # in seconds
 NUM_CORES = 7
 
+print_lock = threading.Lock()
+
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS sessions (
     id INTEGER PRIMARY KEY,
@@ -32,11 +36,19 @@ CREATE TABLE IF NOT EXISTS tests (
     PRIMARY KEY (task_name, session_id),
     FOREIGN KEY (session_id) REFERENCES sessions(id)
 );
+
+-- The primary key cannot serve the per-session queries, since it starts with
+-- task_name. Unlike changing it, the index is also added to existing databases.
+CREATE INDEX IF NOT EXISTS idx_tests_session ON tests(session_id, task_name);
 """
 
 
 def main(args):
     db = sqlite3.connect(args.db)
+    # Each test is committed on its own so that an interrupted session can be
+    # resumed; with WAL and synchronous=NORMAL those commits don't fsync.
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
     db.executescript(SCHEMA)
 
     if args.session is None:
@@ -63,54 +75,95 @@ def get_version(args):
 
 
 def run_tests(args, db, session_id):
-    for test in sorted(glob.glob(args.dir + "/*")):
-        if not os.path.isdir(test):
-            continue
-        task_name = os.path.basename(test)
-        cur = db.cursor()
-        cur.execute("SELECT * FROM tests WHERE task_name = ? AND session_id = ?",
-                    (task_name, session_id))
-        if cur.fetchall():
-            print(f"Task {task_name} already done, skipping")
-            continue
-
-        start_time = datetime.datetime.now()
-        print(f"Starting {task_name} at {start_time}")
-        start = time.monotonic()
-        stdout, stderr, returncode, killed = run_test(args.tm, test)
-        end = time.monotonic()
-        duration = end - start
-
-        cur = db.cursor()
-        cur.execute(
-            "INSERT INTO tests "
-            "(task_name, session_id, start_time, duration, killed,"
-            "stdout, stderr, return_code)"
-            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (task_name, session_id, start_time, duration, killed,
-             stdout, stderr, returncode))
-        db.commit()
-        print(f"Completed {task_name} after {duration:.3f}s")
+    cur = db.cursor()
+    cur.execute("SELECT task_name FROM tests WHERE session_id = ?",
+                (session_id,))
+    done = {row[0] for row in cur}
+    # The tests are independent, and the workers just wait for task-maker, so
+    # a thread pool is enough to run them in parallel. The results are stored
+    # from this thread only.
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        futures = {}
+        for entry in sorted(os.scandir(args.dir), key=lambda e: e.name):
+            # hidden entries are skipped, like glob("*") does
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            task_name = entry.name
+            if task_name in done:
+                log(f"Task {task_name} already done, skipping")
+                continue
+            future = executor.submit(timed_run_test, args.tm, entry.path)
+            futures[future] = task_name
+
+        try:
+            for future in as_completed(futures):
+                task_name = futures[future]
+                start_time, duration, (stdout, stderr, returncode, killed) = \
+                    future.result()
+                cur.execute(
+                    "INSERT INTO tests "
+                    "(task_name, session_id, start_time, duration, killed,"
+                    "stdout, stderr, return_code)"
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (task_name, session_id, start_time, duration, killed,
+                     stdout, stderr, returncode))
+                db.commit()
+                log(f"Completed {task_name} after {duration:.3f}s")
+        except BaseException:
+            # Don't start the queued tests on interruption: the ones already
+            # stored are kept, and the session can be resumed.
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def timed_run_test(tm, task_dir):
+    start_time = datetime.datetime.now()
+    log(f"Starting {os.path.basename(task_dir)} at {start_time}")
+    start = time.monotonic()
+    result = run_test(tm, task_dir)
+    end = time.monotonic()
+    return start_time, end - start, result
+
+
+def log(message):
+    # print is called from many threads, avoid interleaving the lines
+    with print_lock:
+        print(message, flush=True)
 
 
 def run_test(tm, task_dir):
     tm = os.path.abspath(tm)
-    args = [tm, "--task-dir", task_dir, "--num-cores", str(NUM_CORES),
-            "--no-cache", "--ui", "json"]
     cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     os.putenv("RUST_BACKTRACE", "1")
-    try:
-        proc = subprocess.run(args, timeout=TIMEOUT, stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE, cwd=cwd)
-        return proc.stdout, proc.stderr, proc.returncode, False
-    except subprocess.TimeoutExpired:
-        return b"", b"", -1, True
+    # Each run gets its own store: task-maker locks it exclusively, so a shared
+    # one would serialize the parallel runs. The cache is disabled anyway.
+    # The output is sent to temporary files instead of pipes so that it doesn't
+    # accumulate in memory while task-maker runs, and so that it's kept even if
+    # the test times out.
+    with tempfile.TemporaryDirectory(prefix="tmstore.",
+                                     ignore_cleanup_errors=True) as store, \
+            tempfile.TemporaryFile() as stdout, \
+            tempfile.TemporaryFile() as stderr:
+        args = [tm, "--task-dir", task_dir, "--num-cores", str(NUM_CORES),
+                "--no-cache", "--ui", "json", "--store-dir", store]
+        try:
+            proc = subprocess.run(args, timeout=TIMEOUT, stdout=stdout,
+                                  stderr=stderr, cwd=cwd)
+            returncode, killed = proc.returncode, False
+        except subprocess.TimeoutExpired:
+            returncode, killed = -1, True
+        stdout.seek(0)
+        stderr.seek(0)
+        return stdout.read(), stderr.read(), returncode, killed
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--db", help="Database file", default="db.sqlite3")
     parser.add_argument("--session", help="Continue a session", type=int)
+    parser.add_argument("--parallel", help="Number of tests to run at once",
+                        type=int,
+                        default=max((os.cpu_count() or 1) // NUM_CORES, 1))
     parser.add_argument("tm", help="Path to task-maker")
     parser.add_argument("dir", help="Testing directory")
     args = parser.parse_args()